@@ -2,11 +2,22 @@
 
 # Sorting Questions
 
+import bisect
 import collections
+import concurrent.futures
 import itertools
 import functools
+import heapq
 import math
+import multiprocessing
+import os
+import pickle
+import sys
+import tempfile
+import time
+import numpy as np
 import toolz as tz
+from multiprocessing import shared_memory
 
 
 # * 1. Selection Sort
@@ -39,8 +50,8 @@ def insertion_sort(xs):
     sorted_arr = []
 
     for x in xs:
-        for ix, y in sorted_arr:
-            if x >= y:
+        for ix, y in enumerate(sorted_arr):
+            if x < y:
                 sorted_arr.insert(ix, x)
                 break
         else:
@@ -94,12 +105,304 @@ def _quicksort(xs, left, right):
     _quicksort(xs, p+1, right)
 
 def quicksort(xs):
-    "n2 - Recursively: pick a pivot, reorder arround the pivot."
-    _quicksort(xs, 0, len(xs)-1)
-    return xs
+    "nlogn - Pick a pivot, reorder arround the pivot, as an introsort."
+    return introsort(xs)
 
 
 # print(quicksort([1, 2, 5, 3, -120]))
+# print(_quicksort(xs, 0, len(xs)-1))  # the plain recursive version
+
+# ** Introsort
+
+# _quicksort's last element pivot makes sorted or all-equal input n2, and
+# its recursion overflows on a few thousand such elements. Introsort:
+# - pivot on the median of three, or of three medians of three (the ninther)
+# - partition with Hoare's two scans, each a tight loop. Every range's keys
+#   are >= the key just before it, so when the pivot equals that key the
+#   pivot is the range's least: partition three ways instead, < = >, and the
+#   run of equal keys is done at once (as pdqsort does)
+# - leave ranges under _INSERTION_CUTOFF to insertion sort
+# - past 2*log2(n) levels the pivots are bad, so heapsort the range
+# - keep ranges on an explicit stack, the larger side pushed so it stays
+#   O(log n) deep
+
+_INSERTION_CUTOFF = 16
+_NINTHER_CUTOFF = 128
+
+def _insertion_sort_range(xs, left, right):
+    for ix in range(left + 1, right + 1):
+        x = xs[ix]
+        jx = ix - 1
+        while jx >= left and x < xs[jx]:
+            xs[jx + 1] = xs[jx]
+            jx -= 1
+        xs[jx + 1] = x
+
+def _median_of_three(xs, a, b, c):
+    "The index among a, b, c of the median of their values."
+    if xs[a] < xs[b]:
+        if xs[b] < xs[c]:
+            return b
+        return c if xs[a] < xs[c] else a
+
+    if xs[a] < xs[c]:
+        return a
+    return c if xs[b] < xs[c] else b
+
+def _pivot(xs, left, right):
+    mid = (left + right) // 2
+    if right - left < _NINTHER_CUTOFF:
+        return xs[_median_of_three(xs, left, mid, right)]
+
+    step = (right - left) // 8
+    return xs[_median_of_three(
+        xs,
+        _median_of_three(xs, left, left + step, left + 2*step),
+        _median_of_three(xs, mid - step, mid, mid + step),
+        _median_of_three(xs, right - 2*step, right - step, right))]
+
+def partition3(xs, left, right, pivot):
+    """Reorder xs[left:right+1] into < pivot, == pivot, > pivot.
+    Returns (lt, gt), the bounds of the == part."""
+    lt, ix, gt = left, left, right
+
+    while ix <= gt:
+        x = xs[ix]
+        if x < pivot:
+            xs[lt], xs[ix] = x, xs[lt]
+            lt += 1
+            ix += 1
+        elif pivot < x:
+            xs[ix], xs[gt] = xs[gt], x
+            gt -= 1
+        else:
+            ix += 1
+
+    return lt, gt
+
+def _hoare_partition(xs, left, right, pivot):
+    """Reorder xs[left:right+1], pivot among them, to <= pivot then >= pivot.
+    Returns the last index of the first part, which is before right."""
+    i, j = left, right
+
+    while True:
+        while xs[i] < pivot:
+            i += 1
+        while pivot < xs[j]:
+            j -= 1
+        if i >= j:
+            return j
+
+        xs[i], xs[j] = xs[j], xs[i]
+        i += 1
+        j -= 1
+
+def _sift_down(xs, left, root, end):
+    "Max heap sift of xs[left+root] within the heap xs[left:left+end]."
+    x = xs[left + root]
+    child = 2*root + 1
+
+    while child < end:
+        if child + 1 < end and xs[left + child] < xs[left + child + 1]:
+            child += 1
+        if not x < xs[left + child]:
+            break
+        xs[left + root] = xs[left + child]
+        root, child = child, 2*child + 1
+
+    xs[left + root] = x
+
+def _heapsort_range(xs, left, right):
+    n = right - left + 1
+    for root in reversed(range(n // 2)):
+        _sift_down(xs, left, root, n)
+
+    for end in reversed(range(1, n)):
+        xs[left], xs[left + end] = xs[left + end], xs[left]
+        _sift_down(xs, left, 0, end)
+
+def introsort(xs):
+    "nlogn - Quicksort, heapsorting ranges where pivots keep going bad."
+    stack = [(0, len(xs) - 1, 2 * max(len(xs), 1).bit_length())]
+
+    while stack:
+        left, right, depth = stack.pop()
+
+        while right - left >= _INSERTION_CUTOFF:
+            if not depth:
+                _heapsort_range(xs, left, right)
+                break
+            depth -= 1
+
+            pivot = _pivot(xs, left, right)
+            if left and not xs[left - 1] < pivot:
+                left = partition3(xs, left, right, pivot)[1] + 1
+                continue
+
+            mid = _hoare_partition(xs, left, right, pivot)
+            if mid - left < right - mid:
+                stack.append((mid + 1, right, depth))
+                right = mid
+            else:
+                stack.append((left, mid, depth))
+                left = mid + 1
+        else:
+            _insertion_sort_range(xs, left, right)
+
+    return xs
+
+
+# print(introsort([1, 2, 5, 3, -120]))
+# print(introsort([3] * 10 + list(range(20, 0, -1))))
+
+# Seconds for 10^6 elements:
+#               introsort   _quicksort                 sorted
+# random        1.31        1.69                       0.22
+# sorted        0.94        RecursionError from 2000   0.03
+# reversed      0.96        RecursionError             0.03
+# few unique    0.28        RecursionError             0.08
+# (_quicksort takes 10.5s on 2*10^4 sorted elements given the recursion.)
+
+# ** Selection
+
+# Often only the k smallest, or a median, are wanted, not a full sort.
+# Quickselect partitions as quicksort does but follows only the side with
+# index k, n on average. As introselect, it checks that every two
+# partitions at least halve the range; if not the pivots are bad, so it
+# switches to the median of medians of 5, which leaves at least 3/10 of the
+# range to either side, for n at worst. Many ranks are selected in one pass
+# by following every side that holds one, heapsorting past 2*log2(n) levels
+# as introsort does. For k up to _HEAP_SELECT heapq's n log k scan, in C,
+# beats them.
+
+_HEAP_SELECT = 2**15
+
+def _median_of_medians(xs, left, right):
+    "A pivot with at least 3/10 of xs[left:right+1] to either side."
+    medians = []
+    for ix in range(left, right + 1, 5):
+        group = sorted(xs[ix:min(ix + 5, right + 1)])
+        medians.append(group[(len(group) - 1) // 2])
+
+    return _select(medians, len(medians) // 2, 0, len(medians) - 1)
+
+def _select(xs, k, left, right):
+    "Reorder xs[left:right+1] so xs[k] is in its sorted place, return it."
+    size, steps, linear = right - left + 1, 0, False
+
+    while right - left >= _INSERTION_CUTOFF:
+        if linear:
+            lt, gt = partition3(xs, left, right, _median_of_medians(xs, left, right))
+            if gt < k:
+                left = gt + 1
+            elif k < lt:
+                right = lt - 1
+            else:
+                return xs[k]
+            continue
+
+        mid = _hoare_partition(xs, left, right, _pivot(xs, left, right))
+        if k <= mid:
+            right = mid
+        else:
+            left = mid + 1
+
+        steps += 1
+        if not steps % 2:
+            linear, size = right - left + 1 > size // 2, right - left + 1
+
+    _insertion_sort_range(xs, left, right)
+    return xs[k]
+
+def select(xs, k):
+    "n - The k-th smallest of xs, reordered so it's at xs[k], smaller before, larger after."
+    return _select(xs, range(len(xs))[k], 0, len(xs) - 1)
+
+def select_many(xs, ks):
+    "Select every rank of ks in one pass over xs, returning xs[k] for each."
+    ks = [range(len(xs))[k] for k in ks]
+    wanted = sorted(set(ks))
+    stack = [(0, len(xs) - 1, 0, len(wanted), 2 * max(len(xs), 1).bit_length())]
+
+    while stack:
+        left, right, lo, hi, depth = stack.pop()
+        if lo == hi:
+            continue
+        if hi - lo == 1:
+            _select(xs, wanted[lo], left, right)
+        elif right - left < _INSERTION_CUTOFF:
+            _insertion_sort_range(xs, left, right)
+        elif not depth:
+            _heapsort_range(xs, left, right)
+        else:
+            mid = _hoare_partition(xs, left, right, _pivot(xs, left, right))
+            split = bisect.bisect_right(wanted, mid, lo, hi)
+            stack.append((left, mid, lo, split, depth - 1))
+            stack.append((mid + 1, right, split, hi, depth - 1))
+
+    return [xs[k] for k in ks]
+
+def quantiles(xs, qs):
+    "The items at fractions qs (0 to 1) of the way through sorted xs, as select_many."
+    return select_many(xs, [round(q * (len(xs) - 1)) for q in qs])
+
+def partial_sort(xs, k):
+    "Reorder xs so xs[:k] are its k smallest, sorted."
+    if k < len(xs):
+        select(xs, k)
+    xs[:k] = introsort(xs[:k])
+    return xs
+
+def _ranked(xs, n, key, largest):
+    "The n smallest (or largest) of the list xs by key, stably, by selection."
+    n = max(0, min(n, len(xs)))
+    if key is None:
+        ys = xs[:]
+    else:
+        sign = -1 if largest else 1
+        ys = [(key(x), sign * ix) for ix, x in enumerate(xs)]
+
+    if not largest:
+        top = partial_sort(ys, n)[:n]
+    else:
+        if n:
+            select(ys, len(ys) - n)
+        top = introsort(ys[len(ys) - n:])[::-1]
+
+    return top if key is None else [xs[abs(ix)] for _, ix in top]
+
+def nsmallest(xs, n, key=None):
+    "The n smallest of xs by key, as heapq.nsmallest, selecting for large n."
+    xs = list(xs)
+    if n <= _HEAP_SELECT:
+        return heapq.nsmallest(n, xs, key)
+    return _ranked(xs, n, key, largest=False)
+
+def nlargest(xs, n, key=None):
+    "The n largest of xs by key, as heapq.nlargest, selecting for large n."
+    xs = list(xs)
+    if n <= _HEAP_SELECT:
+        return heapq.nlargest(n, xs, key)
+    return _ranked(xs, n, key, largest=True)
+
+# xs = [5, 1, 4, 2, 3, 0]
+# print(select(xs, 2), xs[:2], select_many(xs, [0, -1, 3]), quantiles(xs, [0.5]))
+# print(partial_sort([5, 1, 4, 2, 3, 0], 3), nsmallest(range(10), 3), nlargest('banana', 2))
+# 2 [0, 1] [0, 5, 3] [2]
+# [0, 1, 2, 3, 4, 5] [0, 1, 2] ['n', 'n']
+
+# Seconds for 10^7 random floats:
+# sorted 5.13, introsort 31.9
+# select median 1.49, partial_sort k=100 1.42
+# quantiles: 9 deciles 7.05, 99 percentiles 16.8
+# k        heapq.nsmallest   by selection
+# 10       0.21              1.58
+# 1000     0.52              1.68
+# 10^5     2.73              1.95
+# 10^6     15.3              4.25
+# Selection takes ~2n comparisons in Python where sorted takes n log n in C,
+# so a single rank is 3.5x faster, and heapq 25x for small k. Each quantile
+# costs a pass until the ranks part, so many quantiles approach a sort.
 
 
 # * 4. Merge Sort
@@ -128,10 +431,497 @@ def _mergesort(xs, left, right):
     return merge + L[L_i:] + R[R_i:]
 
 def mergesort(xs):
-    "?? - Recursively: Merge sorted subarrays"
-    return _mergesort(xs, 0, len(xs))
+    "nlogn - Merge sorted subarrays, bottom up."
+    return bottom_up_mergesort(xs)
 
 # print(mergesort([1, 2, 5, 3, -12, -10]))
+# print(_mergesort(xs, 0, len(xs)))  # the recursive version
+
+# ** Bottom up
+
+# _mergesort slices and concatenates new lists at every level, and re-slices
+# R for each element of L. Bottom up there is no recursion: insertion sort
+# runs of _MERGE_RUN, then merge pairs of runs of width 2^k from one
+# preallocated buffer into the other and swap them, doubling the width.
+# A pair already in order (last of the left <= first of the right) is
+# copied, so sorted input is linear.
+
+_MERGE_RUN = 16
+
+def _merge_into(src, left, mid, right, dst):
+    "Stably merge src[left:mid] and src[mid:right] into dst[left:right]."
+    if mid == right or not src[mid] < src[mid - 1]:
+        dst[left:right] = src[left:right]
+        return
+
+    i, j, k = left, mid, left
+    while i < mid and j < right:
+        if src[j] < src[i]:
+            dst[k] = src[j]
+            j += 1
+        else:
+            dst[k] = src[i]
+            i += 1
+        k += 1
+
+    dst[k:k + mid - i] = src[i:mid]
+    dst[k + mid - i:right] = src[j:right]
+
+def bottom_up_mergesort(xs):
+    "nlogn - Merge ever wider runs, back and forth between two buffers."
+    src, n = list(xs), len(xs)
+    for left in range(0, n, _MERGE_RUN):
+        _insertion_sort_range(src, left, min(left + _MERGE_RUN, n) - 1)
+
+    dst, width = src[:], _MERGE_RUN
+    while width < n:
+        for left in range(0, n, 2 * width):
+            _merge_into(src, left, min(left + width, n), min(left + 2*width, n), dst)
+        src, dst = dst, src
+        width *= 2
+
+    return src
+
+# print(bottom_up_mergesort([1, 2, 5, 3, -12, -10] * 5))
+
+# ** Parallel
+
+# Sort a chunk per worker, then merge. For numeric arrays both phases work
+# in place on shared memory, and the merge is split too: splitters sampled
+# from the sorted chunks cut every chunk with searchsorted, and worker j
+# merges the j-th piece of every chunk into its own slice of the output.
+# (Heavily repeated keys can make one piece large.) Lists are pickled to
+# the workers, sorted with bottom_up_mergesort, and merged by heapq.merge,
+# which is stable.
+
+def _shared_array(name, dtype, n):
+    shm = shared_memory.SharedMemory(name)
+    return shm, np.ndarray((n,), dtype, buffer=shm.buf)
+
+def _sort_shared(name, dtype, n, span):
+    shm, a = _shared_array(name, dtype, n)
+    a[span[0]:span[1]].sort(kind="stable")
+    del a
+    shm.close()
+
+def _merge_shared(src_name, dst_name, dtype, n, pieces, offset, kind="stable"):
+    "Sort the src[start:stop] pieces together into dst from offset."
+    src_shm, src = _shared_array(src_name, dtype, n)
+    dst_shm, dst = _shared_array(dst_name, dtype, n)
+
+    merged = dst[offset:offset + sum(stop - start for start, stop in pieces)]
+    np.concatenate([src[start:stop] for start, stop in pieces], out=merged)
+    merged.sort(kind=kind)
+
+    del src, dst, merged
+    src_shm.close()
+    dst_shm.close()
+
+def _parallel_mergesort_array(a, workers):
+    n, dtype = len(a), a.dtype.str
+    src_shm = shared_memory.SharedMemory(create=True, size=max(a.nbytes, 1))
+    dst_shm = shared_memory.SharedMemory(create=True, size=max(a.nbytes, 1))
+
+    try:
+        src = np.ndarray((n,), a.dtype, buffer=src_shm.buf)
+        src[:] = a
+        bounds = np.linspace(0, n, workers + 1).astype(int)
+        spans = list(zip(bounds[:-1].tolist(), bounds[1:].tolist()))
+
+        with concurrent.futures.ProcessPoolExecutor(workers) as pool:
+            list(pool.map(functools.partial(_sort_shared, src_shm.name, dtype, n), spans))
+
+            runs = [src[start:stop] for start, stop in spans if stop > start]
+            sample = np.sort(np.concatenate(
+                [run[np.linspace(0, len(run) - 1, 32 * workers).astype(int)] for run in runs]))
+            splitters = sample[np.linspace(0, len(sample), workers + 1).astype(int)[1:-1]]
+
+            cuts = [start + np.concatenate([[0], np.searchsorted(src[start:stop], splitters),
+                                            [stop - start]])
+                    for start, stop in spans]
+            pieces = [[(cut[j], cut[j + 1]) for cut in cuts] for j in range(workers)]
+            sizes = [sum(stop - start for start, stop in piece) for piece in pieces]
+            offsets = np.cumsum([0] + sizes[:-1]).tolist()
+
+            list(pool.map(functools.partial(_merge_shared, src_shm.name, dst_shm.name, dtype, n),
+                          pieces, offsets))
+
+        del src, runs
+        return np.ndarray((n,), a.dtype, buffer=dst_shm.buf).copy()
+    finally:
+        for shm in (src_shm, dst_shm):
+            shm.close()
+            shm.unlink()
+
+def parallel_mergesort(xs, workers=None):
+    "Stable sort of a list or numeric array, chunks sorted and merged across processes."
+    workers = workers or os.cpu_count()
+
+    if isinstance(xs, np.ndarray):
+        if len(xs) < 2 * workers:
+            return np.sort(xs, kind="stable")
+        return _parallel_mergesort_array(xs, workers)
+
+    xs = list(xs)
+    chunk = -(-len(xs) // workers) or 1
+    with concurrent.futures.ProcessPoolExecutor(workers) as pool:
+        runs = list(pool.map(bottom_up_mergesort, tz.partition_all(chunk, xs)))
+
+    return list(heapq.merge(*runs))
+
+# print(parallel_mergesort(np.array([5, 3, 9, 1, 1, 0, 7, 2]), workers=2))
+# print(parallel_mergesort(['b', 'a', 'd', 'c', 'a'], workers=2))
+
+# Lists of random floats, seconds:
+# n        _mergesort   bottom_up_mergesort   sorted
+# 10^4     0.069        0.011
+# 3*10^4   0.62         0.033
+# 10^6     -            1.8 (0.62 sorted)     0.21
+# 10^8 int64s: np.sort 1.3 (AVX-512), np.sort stable 12.5, and
+# parallel_mergesort 13.9-14.2 with 1 to 8 workers on this one core box.
+# Per task with 8 workers: sorts 1.39s at most (10.9 total), merges 0.29s
+# at most (2.3 total), and 0.9s serial copying in and out, so on 8 cores
+# the critical path is ~2.6s, ~5x over the stable sort; the copies bound it.
+
+# ** Sample sort
+
+# parallel_mergesort sorts every chunk and then sorts (merges) it all again.
+# A sample sort moves each item once before its one sort: sort a random
+# sample, take every _OVERSAMPLE-th item as a splitter, and each worker
+# stably partitions its slice of shared memory into the buckets between
+# splitters, counting them. The counts give each bucket's place in the
+# output, so worker j then gathers bucket j from every slice straight into
+# it and sorts it there. Only spans and counts are pickled. Stable if kind
+# is. (Heavily repeated keys can make one bucket large.)
+
+_OVERSAMPLE = 64
+
+def _bucket_shared(name, dtype, n, splitters, span):
+    "Stably reorder a[start:stop] by bucket, returning the bucket sizes."
+    shm, a = _shared_array(name, dtype, n)
+    piece = a[span[0]:span[1]]
+
+    buckets = np.searchsorted(splitters, piece, "right").astype(np.uint16)
+    piece[:] = piece[np.argsort(buckets, kind="stable")]
+    counts = np.bincount(buckets, minlength=len(splitters) + 1)
+
+    del a, piece
+    shm.close()
+    return counts
+
+def _sample_sort_array(a, workers, kind):
+    n, dtype = len(a), a.dtype.str
+    src_shm = shared_memory.SharedMemory(create=True, size=max(a.nbytes, 1))
+    dst_shm = shared_memory.SharedMemory(create=True, size=max(a.nbytes, 1))
+
+    try:
+        src = np.ndarray((n,), a.dtype, buffer=src_shm.buf)
+        src[:] = a
+        bounds = np.linspace(0, n, workers + 1).astype(int)
+        spans = list(zip(bounds[:-1].tolist(), bounds[1:].tolist()))
+
+        sample = np.sort(a[np.random.default_rng().integers(0, n, _OVERSAMPLE * workers)])
+        splitters = sample[_OVERSAMPLE * np.arange(1, workers)]
+
+        with concurrent.futures.ProcessPoolExecutor(workers) as pool:
+            counts = np.array(list(pool.map(
+                functools.partial(_bucket_shared, src_shm.name, dtype, n, splitters), spans)))
+
+            starts = bounds[:-1, None] + np.cumsum(counts, axis=1) - counts
+            pieces = [list(zip(starts[:, j].tolist(), (starts[:, j] + counts[:, j]).tolist()))
+                      for j in range(workers)]
+            sizes = counts.sum(axis=0)
+            offsets = (np.cumsum(sizes) - sizes).tolist()
+
+            list(pool.map(functools.partial(_merge_shared, src_shm.name, dst_shm.name, dtype, n,
+                                            kind=kind),
+                          pieces, offsets))
+
+        del src
+        return np.ndarray((n,), a.dtype, buffer=dst_shm.buf).copy()
+    finally:
+        for shm in (src_shm, dst_shm):
+            shm.close()
+            shm.unlink()
+
+def sample_sort(a, workers=None, kind=None):
+    "Sorted copy of a numeric array, bucketed by sampled splitters, sorted across processes."
+    a = np.asarray(a)
+    workers = min(workers or os.cpu_count(), 2**16)
+
+    if len(a) < 2 * workers:
+        return np.sort(a, kind=kind)
+    return _sample_sort_array(a, workers, kind)
+
+# print(sample_sort(np.array([5, 3, 9, 1, 1, 0, 7, 2]), workers=2))
+# [0 1 1 2 3 5 7 9]
+
+# 5*10^7 random int64s, np.sort 0.95s. This box has one core, so the wall
+# times only show overhead; a task's time, run alone, gives the critical
+# path on as many cores, plus ~0.25s of serial copying in and out:
+# workers   wall   partition task   bucket sort task   critical path
+# 1         2.9    1.20             0.81               2.3
+# 2         3.8    1.13             0.37               1.8
+# 4         3.7    0.43             0.13               0.8
+# 8         3.4    0.25             0.06               0.55
+# 16        3.8    0.14             0.03               0.4
+# So ~2.4x over np.sort at 16 workers, bounded by the serial copies, and
+# 10^9 items want a caller that keeps them in shared memory to begin with.
+
+# ** External
+
+# For data bigger than memory: read records until their estimated size
+# reaches the memory budget, sort that run and spill it to a temporary file
+# as pickled frames of about _FRAME bytes. Then heapq.merge the runs, reading
+# each a frame at a time. On ties heapq.merge takes the earlier run, and runs
+# are in input order, so with a stable run sort the whole sort is stable. If
+# there are more runs than frames fit in the budget, merge in passes.
+
+_FRAME = 2**20
+_SLOT = 32  # pointers in the run and the sort's two buffers, and malloc rounding
+_DECORATION = 112  # a (key, index) tuple, the index, and pointers to both
+
+def _spill(records, directory):
+    "Write records to a new file in directory as pickled frames, return its path."
+    fd, path = tempfile.mkstemp(suffix=".run", dir=directory)
+
+    with os.fdopen(fd, "wb") as f:
+        frame, size = [], 0
+        for record in records:
+            frame.append(record)
+            size += sys.getsizeof(record) + _SLOT
+            if size >= _FRAME:
+                pickle.dump(frame, f, pickle.HIGHEST_PROTOCOL)
+                frame, size = [], 0
+        if frame:
+            pickle.dump(frame, f, pickle.HIGHEST_PROTOCOL)
+
+    return path
+
+def _read_run(path):
+    with open(path, "rb") as f:
+        while True:
+            try:
+                frame = pickle.load(f)
+            except EOFError:
+                return
+            yield from frame
+
+def _sort_run(run, keys, sort):
+    if not keys:
+        return sort(run)
+    return [run[ix] for _, ix in sort(list(zip(keys, range(len(run)))))]
+
+def _spill_runs(records, key, memory, sort, directory):
+    "Sort records in runs of about memory bytes, yielding the spilled runs' paths."
+    run, keys, size = [], [], 0
+
+    for record in records:
+        run.append(record)
+        size += sys.getsizeof(record) + _SLOT
+        if key is not None:
+            keys.append(key(record))
+            size += sys.getsizeof(keys[-1]) + _DECORATION
+        if size >= memory:
+            yield _spill(_sort_run(run, keys, sort), directory)
+            run, keys, size = [], [], 0
+
+    if run:
+        yield _spill(_sort_run(run, keys, sort), directory)
+
+def _merge_runs(paths, key, directory):
+    path = _spill(heapq.merge(*map(_read_run, paths), key=key), directory)
+    for merged in paths:
+        os.remove(merged)
+    return path
+
+def external_sort(records, key=None, memory=2**29, sort=bottom_up_mergesort, directory=None):
+    "Stably sort an iterable of picklable records in about memory bytes, yielding them."
+    fan_in = max(2, memory // (2 * _FRAME))
+
+    with tempfile.TemporaryDirectory(dir=directory) as tmp:
+        runs = list(_spill_runs(records, key, memory, sort, tmp))
+        while len(runs) > fan_in:
+            runs = [_merge_runs(group, key, tmp) for group in tz.partition_all(fan_in, runs)]
+
+        yield from heapq.merge(*map(_read_run, runs), key=key)
+
+def _lines(f):
+    for line in f:
+        yield line if line.endswith(b"\n") else line + b"\n"
+
+def external_sort_file(src, dst, key=None, memory=2**29, **kwargs):
+    "Sort the lines of file src, as bytes, into file dst."
+    with open(src, "rb") as f, open(dst, "wb", buffering=_FRAME) as out:
+        out.writelines(external_sort(_lines(f), key, memory, **kwargs))
+
+# print(list(external_sort([3, 1, 2, 5, 4, 0], memory=200)))
+# [0, 1, 2, 3, 4, 5]
+# print(list(external_sort(['bb', 'a', 'cc', 'b', 'aa'], key=len, memory=300)))
+# ['a', 'b', 'bb', 'cc', 'aa']
+
+# external_sort_file on 10^8 random 100 byte lines (10 GB) with the default
+# 512 MB budget: 31 runs and one merge pass, 901s (396s with sort=sorted),
+# peak RSS 559 MB, so ~11 MB/s on this one core box. 1 GB takes 77s (32s).
+# Pickling and heapq.merge bound it more than the disk does.
+
+# ** Adaptive
+
+# Timsort's plan, for input mostly in order already:
+# - split the input into its natural runs, ascending or strictly descending
+#   (reversed in place, strictly so equal keys keep their order)
+# - binary insertion sort short runs out to _min_run(n), 32 to 64 long
+# - keep a stack of runs, merging neighbours until each run is longer than
+#   the next two above it together, so merges stay balanced
+# - merge by one at a time comparisons, but once one side wins _MIN_GALLOP
+#   times in a row, gallop: probe 1, 3, 7.. ahead then bisect, and copy the
+#   whole stretch that goes first as a slice
+# Sorted or reversed input is then a single run, found in n-1 comparisons.
+
+_MIN_GALLOP = 7
+
+def _min_run(n):
+    "The top 6 bits of n, plus 1 if any lower bit is set."
+    low = 0
+    while n >= 64:
+        low |= n & 1
+        n >>= 1
+
+    return n + low
+
+def _count_run(xs, lo, hi):
+    "The end of the run at xs[lo], made ascending if it was descending."
+    ix = lo + 1
+    if ix == hi:
+        return hi
+
+    if xs[ix] < xs[lo]:
+        while ix + 1 < hi and xs[ix + 1] < xs[ix]:
+            ix += 1
+        xs[lo:ix + 1] = xs[ix:lo - 1 if lo else None:-1]
+    else:
+        while ix + 1 < hi and not xs[ix + 1] < xs[ix]:
+            ix += 1
+
+    return ix + 1
+
+def _binary_insertion_sort(xs, lo, start, hi):
+    "Extend the sorted xs[lo:start] to a sorted xs[lo:hi]."
+    for ix in range(start, hi):
+        x = xs[ix]
+        at = bisect.bisect_right(xs, x, lo, ix)
+        xs[at + 1:ix + 1] = xs[at:ix]
+        xs[at] = x
+
+def _gallop(x, xs, lo, hi, right):
+    "Where x goes in the sorted xs[lo:hi], after equal keys if right."
+    prev, ix = lo, lo
+    while ix < hi and (not x < xs[ix] if right else xs[ix] < x):
+        prev, ix = ix + 1, 2*ix - lo + 1
+
+    bound = bisect.bisect_right if right else bisect.bisect_left
+    return bound(xs, x, prev, min(ix, hi))
+
+def _merge_galloping(xs, lo, mid, hi, min_gallop):
+    """Stably merge the sorted xs[lo:mid] and xs[mid:hi] in place, from a
+    copy of the left. Returns the new min_gallop."""
+    lo = _gallop(xs[mid], xs, lo, mid, True)
+    hi = _gallop(xs[mid - 1], xs, mid, hi, False)
+    if lo == mid or mid == hi:
+        return min_gallop
+
+    left = xs[lo:mid]
+    i, j, k, n = 0, mid, lo, mid - lo
+
+    while i < n and j < hi:
+        left_wins = right_wins = 0
+        while i < n and j < hi:
+            if xs[j] < left[i]:
+                xs[k] = xs[j]
+                j += 1
+                right_wins += 1
+                left_wins = 0
+                if right_wins >= min_gallop:
+                    k += 1
+                    break
+            else:
+                xs[k] = left[i]
+                i += 1
+                left_wins += 1
+                right_wins = 0
+                if left_wins >= min_gallop:
+                    k += 1
+                    break
+            k += 1
+
+        while i < n and j < hi:
+            end = _gallop(xs[j], left, i, n, True)
+            xs[k:k + end - i] = left[i:end]
+            k, left_wins, i = k + end - i, end - i, end
+            if i == n:
+                break
+
+            end = _gallop(left[i], xs, j, hi, False)
+            xs[k:k + end - j] = xs[j:end]
+            k, right_wins, j = k + end - j, end - j, end
+
+            if left_wins < _MIN_GALLOP and right_wins < _MIN_GALLOP:
+                min_gallop += 1
+                break
+            min_gallop = max(1, min_gallop - 1)
+
+    xs[k:k + n - i] = left[i:]
+    return min_gallop
+
+def _collapse(xs, runs, min_gallop, force=False):
+    """Merge neighbouring (start, end) runs until each is longer than the
+    next two together, or into one if force. Returns the new min_gallop."""
+    while len(runs) > 1:
+        sizes = [end - start for start, end in runs]
+        ix = len(runs) - 2
+        if (force or ix > 0 and sizes[ix - 1] <= sizes[ix] + sizes[ix + 1]
+                or ix > 1 and sizes[ix - 2] <= sizes[ix - 1] + sizes[ix]):
+            if ix > 0 and sizes[ix - 1] < sizes[ix + 1]:
+                ix -= 1
+        elif sizes[ix] > sizes[ix + 1]:
+            break
+
+        (start, mid), (_, end) = runs[ix], runs[ix + 1]
+        min_gallop = _merge_galloping(xs, start, mid, end, min_gallop)
+        runs[ix:ix + 2] = [(start, end)]
+
+    return min_gallop
+
+def adaptive_sort(xs):
+    "n for presorted input, nlogn at worst - merge natural runs, galloping."
+    xs, lo, runs, min_gallop = list(xs), 0, [], _MIN_GALLOP
+    n = len(xs)
+    min_run = _min_run(n)
+
+    while lo < n:
+        hi = _count_run(xs, lo, n)
+        if hi - lo < min_run:
+            _binary_insertion_sort(xs, lo, hi, min(lo + min_run, n))
+            hi = min(lo + min_run, n)
+
+        runs.append((lo, hi))
+        min_gallop = _collapse(xs, runs, min_gallop)
+        lo = hi
+
+    _collapse(xs, runs, min_gallop, force=True)
+    return xs
+
+# print(adaptive_sort([5, 6, 7, 1, 2, 3, 4, 9, 8, 0]))
+# print(adaptive_sort([3, 2, 1] * 30) == sorted([3, 2, 1] * 30))
+
+# Seconds for 10^6 sorted floats with a fraction of them replaced at random:
+# fraction   adaptive_sort   bottom_up_mergesort   introsort   sorted
+# 0          0.32            0.81                  1.49        0.04
+# 0.001      0.62            3.29                  1.75        0.06
+# 0.01       0.95            3.77                  1.55        0.04
+# 0.1        1.65            4.22                  2.46        0.18
+# 1          4.19            5.40                  3.14        0.46
+# reversed   0.25            4.26                  1.28        0.03
 
 
 # * 5. Radix Sort
@@ -158,14 +948,203 @@ def _radixsort(xs, exp, base=10):
     return sorted_xs
 
 def radixsort(xs, base=10):
-    max_exp = math.floor(math.log(max(xs), base))
+    # Negatives sort as their magnitudes, reversed, before the rest
+    # Find the top digit with ints, math.log(1000, 10) is 2.9999999999999996
+    largest = max(map(abs, xs), default=0)
+    max_exp = 0
+    while base**(max_exp+1) <= largest:
+        max_exp += 1
 
-    return _radixsort(xs, max_exp, base=base)
+    negatives = _radixsort([-x for x in xs if x < 0], max_exp, base=base)
+    others = _radixsort([x for x in xs if x >= 0], max_exp, base=base)
+
+    return [-x for x in reversed(negatives)] + others
 
 
 # print(radixsort([1, 2, 5, 3, -12, -10]))
 # print(radixsort([170, 45, 75, 90, 2, 802, 2, 66]))
 # print(radixsort([1, 2, 5, 3, 12, 10, 400, 403, 412]))
+# print(radixsort([0, 0]), radixsort([1000, 999, 1]))
+
+# ** LSD radix sort on arrays
+
+# Least significant digit first: a stable counting sort per digit of
+# `bits`, low to high, leaves the keys sorted. Keys become unsigned ints
+# that order the same way:
+# - signed: flip the sign bit (a bias of 2^(w-1))
+# - floats: negatives flip every bit, others just the sign bit; NaNs last
+# - fixed width bytes: their columns, last first, are the digits
+# Subtracting the least key first skips the passes whose digits are all 0.
+# numpy's stable sort of uint8/uint16 is a counting sort, so that does each
+# pass, and the keys move between two preallocated buffers.
+
+def _radix_keys(a):
+    "Unsigned ints ordered as a is, and the map back."
+    if a.dtype.kind == "u":
+        return a.copy(), lambda keys: keys
+
+    unsigned = np.dtype("u{}".format(a.dtype.itemsize))
+    sign = unsigned.type(1 << (8 * a.dtype.itemsize - 1))
+
+    if a.dtype.kind == "i":
+        return a.view(unsigned) ^ sign, lambda keys: (keys ^ sign).view(a.dtype)
+
+    if a.dtype.kind == "f":
+        bits = a.view(unsigned)
+        keys = np.where(bits & sign, ~bits, bits | sign)
+        keys[np.isnan(a)] = ~unsigned.type(0)
+        return keys, lambda keys: np.where(keys & sign, keys ^ sign, ~keys).view(a.dtype)
+
+    raise TypeError("Can't radix sort {}".format(a.dtype))
+
+def _lsd(keys, bits, order=None):
+    "Unsigned keys (and order alongside) after a stable LSD radix sort."
+    bits = min(bits, 8 * keys.dtype.itemsize)
+    digits = np.empty(len(keys), np.uint8 if bits <= 8 else np.uint16)
+    shifted, spare_keys = np.empty_like(keys), np.empty_like(keys)
+    spare_order = None if order is None else np.empty_like(order)
+    mask = keys.dtype.type((1 << bits) - 1)
+
+    for shift in range(0, int(keys.max(initial=0)).bit_length(), bits):
+        np.right_shift(keys, keys.dtype.type(shift), out=shifted)
+        np.bitwise_and(shifted, mask, out=shifted)
+        np.copyto(digits, shifted, casting="unsafe")
+        perm = np.argsort(digits, kind="stable")
+
+        keys, spare_keys = np.take(keys, perm, out=spare_keys), keys
+        if order is not None:
+            order, spare_order = np.take(order, perm, out=spare_order), order
+
+    return keys, order
+
+def _lsd_bytes(a, bits):
+    "Stable LSD radix argsort of fixed width bytes, a byte or two per digit."
+    width = a.dtype.itemsize
+    columns = a.view(np.uint8).reshape(len(a), width)
+    order, step = np.arange(len(a)), 1 if bits <= 8 else 2
+
+    for lo in reversed(range(0, width, step)):
+        digits = columns[order, lo]
+        if step == 2 and lo + 1 < width:
+            digits = digits.astype(np.uint16) << 8 | columns[order, lo + 1]
+        order = order[np.argsort(digits, kind="stable")]
+
+    return order
+
+def _check_bits(bits):
+    if not 1 <= bits <= 16:
+        raise ValueError("Radix digits must be 1 to 16 bits, not {}".format(bits))
+
+def radix_sort(a, bits=8):
+    "Sorted copy of an int, float or fixed width bytes array, by LSD radix."
+    a = np.asarray(a)
+    _check_bits(bits)
+    if a.dtype.kind == "S":
+        return a[_lsd_bytes(a, bits)]
+
+    keys, restore = _radix_keys(a)
+    least = keys.min(initial=np.iinfo(keys.dtype).max)
+    keys, _ = _lsd(keys - least, bits)
+
+    return restore(keys + least)
+
+def radix_argsort(a, bits=8):
+    "Stable argsort of an int, float or fixed width bytes array, by LSD radix."
+    a = np.asarray(a)
+    _check_bits(bits)
+    if a.dtype.kind == "S":
+        return _lsd_bytes(a, bits)
+
+    keys, _ = _radix_keys(a)
+    least = keys.min(initial=np.iinfo(keys.dtype).max)
+    _, order = _lsd(keys - least, bits, np.arange(len(a)))
+
+    return order
+
+
+# print(radix_sort(np.array([3, -1, 0, -2**63, 2**63-1])).tolist())
+# print(radix_sort(np.array([0.5, -0.0, np.nan, -np.inf, -1.5, 2.0], np.float32), bits=11))
+# print(radix_argsort(np.array([b'ba', b'b', b'ab', b'a', b'b']), bits=16))
+# [-9223372036854775808, -1, 0, 3, 9223372036854775807]
+# [-inf -1.5 -0.   0.5  2.   nan]
+# [3 2 1 4 0]
+
+# Seconds for 10^7 keys (bytes: 10^6). numpy here sorts with AVX-512, and
+# a pass costs an argsort of the digits plus a random gather of the keys:
+#               np.sort   stable   argsort    radix_sort      radix_argsort
+#                                  stable     8/11/16 bits    8/11/16 bits
+# uint32        0.057     1.05     1.52       0.72/0.80/0.60  1.18/1.17/0.86
+# uint32<2^16   0.060     0.87     1.28       0.38/0.45/0.32  0.61/0.67/0.47
+# int64         0.11      1.09     1.62       1.81/1.87/1.43  2.70/2.54/1.95
+# float64       0.11      1.21     1.72       1.91/1.91/1.48  2.66/2.50/1.91
+# bytes S8      0.19      0.22     0.22       0.11/0.10/0.10  0.11/0.09/0.09
+# So it never beats the default np.sort, beats its stable sorts for 32 bit
+# keys (most with 16 bit digits, more for small ranges), loses to them for
+# 64 bit keys, and sorts fixed width bytes twice as fast as numpy.
+
+# ** Typed buffers
+
+# A list of n numbers is n pointers to n boxed objects, and a comparison
+# follows two of them. Anything with the buffer protocol (array.array,
+# bytearray, a writable memoryview, an ndarray) views as an ndarray of its
+# element type without a copy, and sorts in place in C: numpy's default
+# sort (introsort) in place, its stable sort in place for 16 bit ints or
+# smaller (a counting sort, so the default for them), else with n/2 items
+# of scratch (timsort). kind="radix" uses radix_sort, a copy. Records sort
+# by one field through a stable argsort of the field, taken back: an index
+# and one copy of the records.
+
+def buffer_array(buf, writable=True):
+    "A 1-d ndarray over buf's memory, of its element type, not a copy."
+    a = buf if isinstance(buf, np.ndarray) else np.asarray(memoryview(buf))
+    if a.ndim != 1:
+        raise ValueError("Can only sort 1-d buffers, not {}-d".format(a.ndim))
+    if writable and not a.flags.writeable:
+        raise TypeError("Can't sort a read-only buffer in place")
+
+    return a
+
+def sort_buffer(buf, field=None, kind=None):
+    "Sort buf in place by its element type, or its records by one field."
+    a = buffer_array(buf)
+    if field is not None:
+        a[:] = a[argsort_buffer(a, field, kind or "stable")]
+    elif kind == "radix":
+        a[:] = radix_sort(a)
+    elif kind is None and a.dtype.kind in "biu" and a.dtype.itemsize <= 2:
+        a.sort(kind="stable")
+    else:
+        a.sort(kind=kind)
+
+    return buf
+
+def argsort_buffer(buf, field=None, kind="stable"):
+    "Indices that sort buf, or its records by one field."
+    a = buffer_array(buf, writable=False)
+    if field is not None:
+        a = a[field]
+
+    return radix_argsort(a) if kind == "radix" else np.argsort(a, kind=kind)
+
+# xs = array.array('d', [2.5, -1.0, 0.0]); sort_buffer(xs); print(xs)
+# print(sort_buffer(bytearray(b'radix')), argsort_buffer(memoryview(b'cab')))
+# records = np.array([(1, 0.5), (2, -1.0), (3, 0.5)], [('id', 'i8'), ('score', 'f8')])
+# print(sort_buffer(memoryview(records), 'score', kind='radix') and records['id'])
+# array('d', [-1.0, 0.0, 2.5])
+# bytearray(b'adirx') [1 2 0]
+# [2 1 3]
+
+# 10^7 random int64s, best of 2, with the peak memory tracemalloc saw (numpy
+# arrays, not numpy's internal sort scratch):
+# list.sort                       7.18s    38 MB, on top of the list's 400 MB
+# sort_buffer(array('q'))         0.13s    0
+#   kind="stable"                 1.14s    0
+#   kind="radix"                  2.56s    467 MB
+# sorted(range(n), key=getitem)   27.7s    534 MB
+# argsort_buffer                  2.00s    76 MB, the index
+# 10^7 bytes: list.sort 1.49s, sort_buffer(bytearray) 0.05s
+# 10^6 (id, score) records by score: tuples with key=itemgetter(1) 0.35s
+# (15 MB), sort_buffer(records, 'score') 0.19s (23 MB)
 
 
 # * 6. Sort an Array of strings so anagrams are next to eachother
@@ -206,6 +1185,150 @@ def anagramsort_stable(xs):
 # print(anagramsort_stable(['ram', 'act', 'arm', 'bat', 'cat', 'tab']))
 # ['arm', 'ram', 'act', 'cat', 'bat', 'tab']
 
+# ** Anagram index
+
+# Sorting each word's letters costs O(L log L) and a new string per word.
+# Instead give every char a prime: by unique factorization the product of a
+# word's primes is the same exactly for its anagrams, so the product is a
+# collision free O(L) signature. Common letters get the small primes.
+# Groups count their words, so a repeated word costs a count, not a copy,
+# and removal is O(1). Batches are counted first (in C), so each distinct
+# word of a batch is signed once.
+
+_LETTERS = "etaoinshrdlcumwfgypbvkjxqz"
+_PRIMES = [2, 3, 5, 7, 11, 13]
+_CHAR_PRIMES = {}
+
+def _primes_below(n):
+    sieve = bytearray([1]) * n
+    sieve[:2] = b"\0\0"
+    for i in range(2, math.isqrt(n) + 1):
+        if sieve[i]:
+            sieve[i*i::i] = bytes(len(range(i*i, n, i)))
+
+    return list(itertools.compress(range(n), sieve))
+
+def _char_prime(c):
+    "The prime of c: by rank in _LETTERS, then by code point."
+    rank = _LETTERS.find(c)
+    if rank < 0:
+        rank = len(_LETTERS) + ord(c)
+
+    while len(_PRIMES) <= rank:
+        _PRIMES[:] = _primes_below(2 * _PRIMES[-1])
+
+    return _PRIMES[rank]
+
+def anagram_signature(word):
+    "Product of the primes of word's chars, equal exactly for anagrams."
+    try:
+        return math.prod(map(_CHAR_PRIMES.__getitem__, word))
+    except KeyError:
+        _CHAR_PRIMES.update((c, _char_prime(c)) for c in set(word))
+        return math.prod(map(_CHAR_PRIMES.__getitem__, word))
+
+class AnagramIndex(object):
+    def __init__(self, words=()):
+        self._groups = {}
+        self._size = 0
+        self.update(words)
+
+    def __len__(self):
+        return self._size
+
+    def __contains__(self, word):
+        return word in self._groups.get(anagram_signature(word), ())
+
+    def __iter__(self):
+        "Words, repeats included, grouped by anagram in first seen order."
+        for group in self._groups.values():
+            for word, count in group.items():
+                yield from itertools.repeat(word, count)
+
+    def add(self, word, count=1):
+        signature = anagram_signature(word)
+        group = self._groups.get(signature)
+        if group is None:
+            group = self._groups[signature] = {}
+
+        group[word] = group.get(word, 0) + count
+        self._size += count
+
+    def remove(self, word):
+        signature = anagram_signature(word)
+        group = self._groups.get(signature, {})
+        if word not in group:
+            raise KeyError(word)
+
+        group[word] -= 1
+        if not group[word]:
+            del group[word]
+            if not group:
+                del self._groups[signature]
+        self._size -= 1
+
+    def update(self, words):
+        "Add words (or a Counter of them), signing each distinct word once."
+        for word, count in collections.Counter(words).items():
+            self.add(word, count)
+
+    def group_of(self, word):
+        "The distinct indexed anagrams of word."
+        return list(self._groups.get(anagram_signature(word), ()))
+
+    def groups(self):
+        return [list(group) for group in self._groups.values()]
+
+# For a 10^8 word corpus the parent shouldn't touch every word: shipping
+# them to workers costs more than counting them. So split the file into
+# ranges ending at newlines, each worker counts the words of its own range,
+# and the parent sums the counts in file order and signs each distinct word.
+
+def _line_ranges(path, chunk_size):
+    "Byte ranges of about chunk_size covering the file, each ending at a newline."
+    size, bounds = os.path.getsize(path), [0]
+
+    with open(path, "rb") as f:
+        while bounds[-1] < size:
+            f.seek(bounds[-1] + chunk_size)
+            f.readline()
+            bounds.append(min(f.tell(), size))
+
+    return list(zip(bounds, bounds[1:]))
+
+def _count_range(path, span):
+    start, end = span
+    with open(path, "rb") as f:
+        f.seek(start)
+        return collections.Counter(f.read(end - start).decode().split())
+
+def build_anagram_index(path, processes=None, chunk_size=2**24):
+    "AnagramIndex of the whitespace separated words of a file, across processes."
+    counts = collections.Counter()
+
+    with multiprocessing.Pool(processes) as pool:
+        ranges = _line_ranges(path, chunk_size)
+        for part in pool.imap(functools.partial(_count_range, path), ranges):
+            counts.update(part)
+
+    return AnagramIndex(counts)
+
+# x = AnagramIndex(['ram', 'act', 'arm', 'bat', 'cat', 'tab', 'act'])
+# print(x.group_of('mar'), x.group_of('tca'), x.group_of('dog'))
+# ['ram', 'arm'] ['act', 'cat'] []
+# x.remove('ram'); print(list(x), len(x), 'ram' in x)
+# ['arm', 'act', 'act', 'cat', 'bat', 'tab'] 6 False
+# with open('words.txt', 'w') as f: f.write('ram act\narm\nbat\n')
+# print(build_anagram_index('words.txt', chunk_size=2).groups())
+# [['ram', 'arm'], ['act'], ['bat']]
+
+# Seconds, for 2*10^7 Zipf distributed words over a 10^6 word vocabulary:
+# anagramsort_stable 23.2, AnagramIndex 2.8 (545647 groups), and
+# build_anagram_index 6.7 from a file with one worker (this box has one
+# core), ~3*10^6 words/s per worker. Over 10^6 distinct words:
+# anagramsort_stable 2.5-3.6, AnagramIndex 1.3. group_of takes 1.5us where
+# scanning the vocabulary for anagrams takes 740ms.
+
 # * 7. Find an item in a sorted, rotated array
 # ** Commentary
 
@@ -238,7 +1361,7 @@ def _rotsearch(x, xs, l, r):
     low, high = xs[l], xs[r]
 
     if l >= r:
-        return x == low and l
+        return l if x == low else None
 
     rotated = low > high
     if not rotated and (x < low or x > high):
@@ -246,7 +1369,8 @@ def _rotsearch(x, xs, l, r):
 
     m = (r-l)//2 + l
 
-    return _rotsearch(x, xs, l, m) or _rotsearch(x, xs, m+1, r)
+    found = _rotsearch(x, xs, l, m)
+    return found if found is not None else _rotsearch(x, xs, m+1, r)
 
 def rotsearch(x, xs):
     return _rotsearch(x, xs, 0, len(xs)-1)
@@ -255,3 +1379,238 @@ def rotsearch(x, xs):
 # print(rotsearch(7, [5, 6, 7, 8, 1, 2, 3, 4])) # 2
 # print(rotsearch(1, [7, 8, 1, 2, 3, 4, 5, 6])) # 2
 # print(rotsearch(5, [7, 8, 1, 2, 3, 4, 5, 6])) # 6
+# print(rotsearch(7, [7, 8, 1, 2, 3, 4, 5, 6])) # 0
+
+# ** Cached pivot
+
+# _rotsearch follows both halves of a range that holds the rotation, and
+# pays a recursion per level, for every query. The rotation point (the
+# least item's index) only needs finding once: binary search comparing the
+# middle with the range's last item. After it xs[p:] and xs[:p] are sorted,
+# and every item of xs[:p] is >= xs[0] >= those of xs[p:], so a query
+# bisects one of them. Equal middle and last items say nothing of the side
+# the point is on, so the range shrinks by one; with many duplicates
+# finding it is linear at worst (no search can do better), queries aren't.
+
+def rotation_point(xs):
+    "The p where a rotated sorted xs starts, so xs[p:] + xs[:p] is sorted."
+    lo, hi = 0, len(xs) - 1
+
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if xs[hi] < xs[mid]:
+            lo = mid + 1
+        elif xs[mid] < xs[hi]:
+            hi = mid
+        elif xs[hi] < xs[hi - 1]:
+            return hi
+        else:
+            hi -= 1
+
+    return lo
+
+class RotatedArray(object):
+    def __init__(self, xs):
+        self.xs = xs
+        self.pivot = rotation_point(xs)
+        self._array = None
+
+    def __len__(self):
+        return len(self.xs)
+
+    def __contains__(self, x):
+        return self.contains(x)
+
+    def _bounds(self, x):
+        if self.pivot and not x < self.xs[0]:
+            return 0, self.pivot
+        return self.pivot, len(self.xs)
+
+    def find(self, x):
+        "An index of x in xs, or -1."
+        lo, hi = self._bounds(x)
+        ix = bisect.bisect_left(self.xs, x, lo, hi)
+        return ix if ix < hi and self.xs[ix] == x else -1
+
+    def index(self, x):
+        ix = self.find(x)
+        if ix < 0:
+            raise ValueError("{} is not in the array".format(x))
+        return ix
+
+    def contains(self, x):
+        return self.find(x) >= 0
+
+    def find_many(self, queries):
+        "Array of an index of each query in xs, or -1, by searchsorted."
+        if self._array is None:
+            self._array = np.asarray(self.xs)
+        a, p, n = self._array, self.pivot, len(self.xs)
+        queries = np.asarray(queries)
+        if not n:
+            return np.full(len(queries), -1, np.intp)
+
+        left = (queries >= a[0]) if p else np.zeros(len(queries), bool)
+        ixs = np.empty(len(queries), np.intp)
+        ixs[left] = np.searchsorted(a[:p], queries[left])
+        ixs[~left] = p + np.searchsorted(a[p:], queries[~left])
+
+        ends = np.where(left, p, n)
+        found = (ixs < ends) & (a[np.minimum(ixs, n - 1)] == queries)
+        return np.where(found, ixs, -1)
+
+    def contains_many(self, queries):
+        "Boolean array of which queries are in xs."
+        return self.find_many(queries) >= 0
+
+x = RotatedArray([7, 8, 1, 2, 3, 4, 5, 6])
+assert(x.pivot == 2 and x.index(7) == 0 and x.index(1) == 2 and x.index(6) == 7)
+assert(9 not in x and 0 not in x and x.find_many([7, 6, 0, 9, 3]).tolist() == [0, 7, -1, -1, 4])
+assert(RotatedArray([1, 1, 2, 1]).pivot == 3)
+assert(RotatedArray([2, 0, 1]).contains_many([0, 2]).all())
+
+# Seconds for 10^6 random queries, half of them present, on 10^6 rotated
+# distinct ints: rotsearch 13.0, RotatedArray.find 2.15 (`in` 2.37) after a
+# 40us rotation_point, find_many 0.53 given a list (0.40 given an array).
+
+
+# * 8. Picking a sort
+
+# Each sort above wins somewhere. sort profiles the keys and picks:
+# - under _INSERTION_CUTOFF items: insertion sort
+# - no descents, or only descents, among the sampled pairs: adaptive_sort,
+#   which takes a single pass over sorted or reversed input
+# - all ints (or all floats) that fit int64: numpy, counting sort if their
+#   range is under 2n, else radix_sort with 16 bit digits (radix_argsort
+#   for both, with a key)
+# - under 1 in _PRESORTED sampled pairs out of order: adaptive_sort
+# - under 1 in _PRESORTED sampled keys distinct, for str, bytes, bool and
+#   big ints: count each key in a dict, sort the distinct keys and expand
+# - else introsort
+# Types and the range take a pass in C; the rest looks at _PROFILE_SAMPLE
+# random positions. With a key the keys are sorted with their indices, so
+# it's stable.
+
+_PROFILE_SAMPLE = 1024
+_PRESORTED = 8
+_HASHABLE = ("str", "bytes", "bool", "bigint")
+
+def profile_keys(keys):
+    "The type, range, descent rate and distinct rate sort bases its choice on."
+    n = len(keys)
+    types = set(map(type, keys))
+    kind = types.pop().__name__ if len(types) == 1 else "mixed"
+
+    lo = hi = None
+    if kind in ("int", "float") and n:
+        try:
+            a = np.array(keys, np.int64 if kind == "int" else np.float64)
+            lo, hi = a.min().item(), a.max().item()
+        except OverflowError:
+            kind = "bigint"
+
+    at = np.random.default_rng().integers(0, max(n - 1, 1), min(n, _PROFILE_SAMPLE)).tolist()
+    descents = sum(keys[ix + 1] < keys[ix] for ix in at if ix + 1 < n)
+    sample = [keys[ix] for ix in at]
+    try:
+        distinct = len(set(sample)) if kind != "mixed" else len(sample)
+        distinct /= max(len(set(at)), 1)
+    except TypeError:
+        distinct = 1  # Unhashable keys, like lists, can't be counted
+
+    return {"n": n, "kind": kind, "range": (lo, hi),
+            "descents": descents / max(len(at), 1), "distinct": distinct}
+
+def choose_sort(profile):
+    "The name of the algorithm sort uses for keys of that profile."
+    n, kind, (lo, hi) = profile["n"], profile["kind"], profile["range"]
+    disorder = min(profile["descents"], 1 - profile["descents"])
+
+    if n < _INSERTION_CUTOFF:
+        return "insertion"
+    if not disorder:
+        return "adaptive"
+    if kind == "int" and hi - lo < 2 * n:
+        return "counting"
+    if kind in ("int", "float"):
+        return "radix"
+    if disorder * _PRESORTED < 1:
+        return "adaptive"
+    if kind in _HASHABLE and profile["distinct"] * _PRESORTED < 1:
+        return "counting"
+    return "introsort"
+
+def _group_sort(xs, keys, key):
+    "xs sorted by counting, or with a key grouping, equal keys in a dict."
+    if key is None:
+        counts = collections.Counter(keys)
+        return list(itertools.chain.from_iterable(
+            itertools.repeat(k, counts[k]) for k in introsort(list(counts))))
+
+    groups = {}
+    for k, x in zip(keys, xs):
+        groups.setdefault(k, []).append(x)
+    return list(itertools.chain.from_iterable(groups[k] for k in introsort(list(groups))))
+
+def sort(xs, key=None, report=None):
+    """Sorted copy of xs by key, with the algorithm choose_sort picks for it.
+    A dict passed as report gets the profile, the choice and the seconds."""
+    start = time.perf_counter()
+    xs = list(xs)
+    keys = xs if key is None else [key(x) for x in xs]
+    profile = profile_keys(keys)
+    algorithm = choose_sort(profile)
+    chosen = time.perf_counter()
+
+    if algorithm == "counting" and profile["kind"] != "int":
+        result = _group_sort(xs, keys, key)
+    elif algorithm in ("counting", "radix"):
+        a = np.array(keys, np.int64 if profile["kind"] == "int" else np.float64)
+        if key is not None:
+            result = [xs[ix] for ix in radix_argsort(a, bits=16).tolist()]
+        elif algorithm == "counting":
+            lo = profile["range"][0]
+            counts = np.bincount(a - lo)
+            result = np.repeat(np.arange(lo, lo + len(counts)), counts).tolist()
+        else:
+            result = radix_sort(a, bits=16).tolist()
+    else:
+        result = xs if key is None else list(zip(keys, range(len(xs))))
+        if algorithm == "insertion":
+            _insertion_sort_range(result, 0, len(result) - 1)
+        elif algorithm == "adaptive":
+            result = adaptive_sort(result)
+        else:
+            introsort(result)
+        if key is not None:
+            result = [xs[ix] for _, ix in result]
+
+    if report is not None:
+        report.update(profile, algorithm=algorithm,
+                      seconds={"profile": chosen - start, "sort": time.perf_counter() - chosen})
+    return result
+
+# report = {}
+# print(sort([3, 1, 2] * 10, report=report)[:5], report["algorithm"],
+#       sort(['b', 'a'] * 9, key=str.upper)[:3])
+# [1, 1, 1, 1, 1] counting ['a', 'a', 'a']
+
+assert(sort([[3], [1], [2]] * 10) == sorted([[3], [1], [2]] * 10))
+assert(sort([{3}, {1}] * 10, key=sorted) == sorted([{3}, {1}] * 10, key=sorted))
+
+# Seconds for 10^6 keys, best of 3, and what sort picked:
+# keys                  sort   introsort   adaptive   bottom_up   radix_sort   picked
+# random floats         0.33   2.69        3.76       2.43        0.20         radix
+# random ints < 2^40    0.18   2.23        2.36       2.43        0.20         radix
+# ints < 1000           0.10   1.02        2.16       2.32        0.12         counting
+# sorted floats         0.31   0.74        0.14       0.60        0.29         adaptive
+# 1% replaced floats    0.34   1.05        0.55       2.40        0.33         radix
+# reversed floats       0.43   1.54        0.24       3.69        0.38         adaptive
+# random strings        3.10   2.81        3.63       4.14        -            introsort
+# sorted strings        0.31   1.71        0.27       0.94        -            adaptive
+# 1% replaced strings   1.01   2.63        0.88       3.78        -            adaptive
+# reversed strings      0.45   2.17        0.35       4.31        -            adaptive
+# 10 distinct strings   0.10   0.62        1.72       2.75        -            counting
+# radix_sort's column includes the list to array and back. Every pick is
+# the best single sort (or a counting sort none of them has), and sort is
+# within its overhead of it: profiling, conversions and noise, 0.1-0.3s.